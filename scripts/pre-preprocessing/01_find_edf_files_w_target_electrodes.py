@@ -1,8 +1,16 @@
-import os, re, csv
+import io, os, re, csv, mmap, shutil
+from multiprocessing import Pool
 
 """
 Stream headers.txt.
 
+ - headers.txt is memory-mapped and matched as bytes; only captured values
+   (path, age, gender, duration, fs, channel labels) are decoded to str.
+ - Records are independent, so the file is cut into byte ranges that each start on
+   a .edf line; ranges are parsed by NUM_WORKERS processes into part files, and each
+   part is appended to OUTPUT_CSV (in file order) as soon as it and all earlier
+   parts are done, so an interrupted run keeps the rows of the finished ranges.
+
  - When SELECTIVE_ELECTRODES is True: write CSV rows only for files that contain ALL TARGET_ELECTRODES.
  - CSV columns: filepath, age, gender, duration, fs
 """
@@ -11,6 +19,10 @@ Stream headers.txt.
 # CONFIGURATION 
 INPUT_TXT = "../../TUH-EEG/headers.txt"
 OUTPUT_CSV = "../../outputs/TUH-EEG_selective_16.csv"
+FLUSH_EVERY = 4096  # rows buffered before writerows() + flush, so an interrupted run keeps most rows
+# parser processes; CPUs this process may run on (affinity / cgroup cpusets), not host cores
+NUM_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+RANGES_PER_WORKER = 8  # more, smaller ranges than workers, so finished rows reach OUTPUT_CSV steadily
 
 # When True, only write files that contain ALL TARGET_ELECTRODES.
 # When False, write a row for every file record (no electrode filtering).
@@ -20,24 +32,43 @@ TARGET_ELECTRODES = [
     "EEG FP1-REF", "EEG FP2-REF", "EEG O1-REF", "EEG O2-REF",
     "EEG P3-REF", "EEG P4-REF", "EEG T3-REF", "EEG T4-REF", "EEG T5-REF", "EEG T6-REF"
 ]
+# raw-bytes form, compared directly against the (already stripped) labels found in headers.txt
+TARGET_SET = frozenset(t.encode('ascii') for t in TARGET_ELECTRODES)
 
 
 # re
-RE_EDF = re.compile(r'([A-Za-z0-9_\- ./\\]+\.(?:edf))', re.I)
-RE_LPTI_AGE = re.compile(r'lpti[_\s-]*age\s*[:=]?\s*\[?\s*([^\]\r\n]+?)\s*\]?', re.I)
-RE_LPTI_GENDER = re.compile(r'lpti[_\s-]*gender\s*[:=]?\s*\[?\s*([^\]\r\n]+?)\s*\]?', re.I)
-RE_GENERIC_AGE = re.compile(r'Age[:=]?\s*([0-9]{1,3})', re.I)
-RE_AGE_ALT = re.compile(r'([0-9]{1,3})\s*(?:y\b|yrs?\b|years?\b)', re.I)
-RE_DIGITS = re.compile(r'([0-9]{1,3})')
-RE_GENDER_KEYWORD = re.compile(r'\b(?:gender|sex|lpti[_\s-]*gender|patient[_\s-]*sex)\b', re.I)
-RE_SINGLE_MF = re.compile(r'\b([MF])\b', re.I)
-RE_BLOCK_HEADER = re.compile(r'^\s*Block\s+(\d+)\s*:', re.I)
-RE_DURATION = re.compile(r'duration of recording\s*\(secs\)\s*=\s*([0-9]+(?:\.[0-9]+)?)', re.I)
-RE_CHANNEL_LINE = re.compile(r'channel\[\s*\d+\s*\]:.*\(([^)]+)\)')  # captures text inside (...) after channel line
-RE_CHAN_LABELS = re.compile(r'chan_labels\s*\(\s*\d+\s*\)\s*=\s*(.+)', re.I)
-RE_FS = re.compile(r'hdr_sample_frequency\s*=\s*([0-9]+(?:\.[0-9]+)?)', re.I)
+# Patterns without a trailing flag are matched against the lowercased line (low), so no
+# per-character case folding happens inside the regex engine; cased text (paths, labels)
+# is sliced from the original line with the match span.
+# Structural tokens are found in one finditer() pass per line; m.lastgroup names the token.
+# Every alternative has an outer named group so lastgroup is that name even with inner groups.
+# The edf path may only start where a run of path characters starts (lookbehind), so a
+# line is not re-scanned and backtracked from every position inside one long run.
+RE_TOKENS = re.compile(
+    rb'(?<![a-z0-9_\- ./\\])(?P<edf>[a-z0-9_\- ./\\]+\.edf)(?![a-z0-9])'
+    rb'|(?P<block>^\s*block\s+(?P<block_num>\d+)\s*:)'
+    rb'|(?P<duration>duration of recording\s*\(secs\)\s*=\s*(?P<duration_val>[0-9]+(?:\.[0-9]+)?))'
+    rb'|(?P<fs>hdr_sample_frequency\s*=\s*(?P<fs_val>[0-9]+(?:\.[0-9]+)?))'
+    rb'|(?P<channel>channel\[\s*\d+\s*\]:.*\((?P<channel_name>[^)]+)\))')  # e.g. channel[   0]:   256.0 Hz (EEG FP1-REF)
+RE_LPTI_AGE = re.compile(rb'lpti[_\s-]*age\s*[:=]?\s*\[?\s*([^\]\r\n]+?)\s*\]?')
+RE_LPTI_GENDER = re.compile(rb'lpti[_\s-]*gender\s*[:=]?\s*\[?\s*([^\]\r\n]+?)\s*\]?')
+RE_GENERIC_AGE = re.compile(rb'age[:=]?\s*([0-9]{1,3})')
+RE_AGE_ALT = re.compile(rb'([0-9]{1,3})\s*(?:y\b|yrs?\b|years?\b)')
+RE_DIGITS = re.compile(rb'([0-9]{1,3})')
+RE_GENDER_KEYWORD = re.compile(rb'\b(?:gender|sex|lpti[_\s-]*gender|patient[_\s-]*sex)\b')
+RE_SINGLE_MF = re.compile(rb'\b([mf])\b')
+RE_CHAN_LABELS = re.compile(rb'chan_labels\s*\(\s*\d+\s*\)\s*=\s*(.+)')
 
 # helper functions
+def to_text(raw):
+    return raw.decode('utf-8', errors='replace')
+
+def map_readonly(fh):
+    """Read-only mmap of an open binary file (mmap refuses empty files, so use an empty buffer)."""
+    if os.fstat(fh.fileno()).st_size == 0:
+        return io.BytesIO()
+    return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
 def normalize_gender(raw):
     if not raw:
         return None
@@ -59,10 +90,11 @@ def extract_digits_from_text(s):
         return None
     m = RE_DIGITS.search(s)
     if m:
-        return m.group(1)
+        return to_text(m.group(1))
     return None
 
 def parse_line_for_age(line):
+    """line must already be lowercased."""
     m = RE_LPTI_AGE.search(line)
     if m:
         d = extract_digits_from_text(m.group(1))
@@ -70,43 +102,69 @@ def parse_line_for_age(line):
             return d
     m = RE_GENERIC_AGE.search(line)
     if m:
-        return m.group(1)
+        return to_text(m.group(1))
     m = RE_AGE_ALT.search(line)
     if m:
-        return m.group(1)
+        return to_text(m.group(1))
     return None
 
 def parse_line_for_gender(line):
+    """line must already be lowercased."""
     m = RE_LPTI_GENDER.search(line)
     if m:
-        return normalize_gender(m.group(1))
+        return normalize_gender(to_text(m.group(1)))
     if RE_GENDER_KEYWORD.search(line):
         m2 = RE_SINGLE_MF.search(line)
         if m2:
-            return normalize_gender(m2.group(1))
+            return normalize_gender(to_text(m2.group(1)))
     return None
 
+def scan_enclosed(s, open_c, close_c):
+    """
+    Non-empty contents of every open_c ... close_c pair in s (no nesting), left to right.
+    Same result as re.findall on a [^close]+ pattern, but only C-level find() calls.
+    """
+    out = []
+    i = 0
+    while True:
+        a = s.find(open_c, i)
+        if a < 0:
+            return out
+        b = s.find(close_c, a + 1)
+        if b < 0:
+            return out
+        if b > a + 1:
+            out.append(s[a + 1:b])
+        i = b + 1
+
 def extract_bracket_items(s):
     """Extract items inside square brackets [ ... ] possibly repeated. Returns list of trimmed items."""
-    return [it.strip() for it in re.findall(r'\[([^\]]+)\]', s)]
+    return [it.strip() for it in scan_enclosed(s, b'[', b']')]
+
+def add_channel_name(current, name):
+    """Tick name off the record's remaining target electrodes; set 'matched' once none are left."""
+    remaining = current['remaining']
+    if name in remaining:
+        remaining.discard(name)
+        if not remaining:
+            current['matched'] = True
 
-def flush_and_write(current, writer):
+def flush_and_write(current, rows):
     """
-    Write the CSV row for current record according to SELECTIVE_ELECTRODES flag.
-    current: dict with keys 'path','age','gender','duration','fs','chan_names' (set)
-    returns True if a row was written.
+    Append the CSV row for current record to rows according to SELECTIVE_ELECTRODES flag.
+    current: dict with keys 'path','age','gender','duration','fs',
+             'remaining' (TARGET_SET labels not seen yet), 'matched' (True once remaining is empty)
+    rows: list of pending rows, written in batches with csv.writer.writerows
+    returns True if a row was added.
     """
     if not current or not current.get('path'):
         return False
 
-    if SELECTIVE_ELECTRODES:
-        present = set([c.strip() for c in current.get('chan_names', set())])
-        need = set(TARGET_ELECTRODES)
-        if not need.issubset(present):
-            return False
+    if SELECTIVE_ELECTRODES and not current['matched']:
+        return False
 
-    # write row (filepath, age, gender, duration, fs)
-    writer.writerow([
+    # row (filepath, age, gender, duration, fs)
+    rows.append([
         current.get('path'),
         current.get('age') or '',
         current.get('gender') or '',
@@ -115,33 +173,78 @@ def flush_and_write(current, writer):
     ])
     return True
 
-# main streaming processor
-def process_stream(inpath, outpath):
-    if not os.path.isfile(inpath):
-        raise SystemExit(f"Input file not found: {inpath}")
+def is_record_start(raw_line):
+    """True if the line holds a .edf path, i.e. the parser starts a new record on it."""
+    low = raw_line.rstrip(b'\n\r').lower()
+    return b'.edf' in low and any(m.lastgroup == 'edf' for m in RE_TOKENS.finditer(low))
 
+def split_ranges(inpath, parts):
+    """
+    Cut inpath into at most parts (start, end) byte ranges. Every range but the first
+    starts at the beginning of a record line, so no record is split between ranges.
+    """
+    size = os.path.getsize(inpath)
+    bounds = [0]
+    with open(inpath, 'rb') as fh, map_readonly(fh) as mm:
+        for k in range(1, parts):
+            pos = max(size * k // parts, bounds[-1])
+            mm.seek(pos)
+            if pos:
+                mm.readline()   # finish the line pos falls in
+            while True:
+                pos = mm.tell()
+                raw_line = mm.readline()
+                if not raw_line or is_record_start(raw_line):
+                    break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a] or [(0, size)]
+
+# streaming processor for one byte range
+def process_range(inpath, start, end, outpath, header):
+    """Parse lines of inpath in [start, end) and write their CSV rows to outpath. Returns (scanned, written)."""
     scanned = 0
     written = 0
     current = None
     current_block = None
 
-    with open(inpath, 'r', encoding='utf-8', errors='replace') as fh, \
-         open(outpath, 'w', newline='', encoding='utf-8') as csvf:
+    with open(inpath, 'rb') as fh, map_readonly(fh) as mm, \
+         open(outpath, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvf:
 
         writer = csv.writer(csvf)
-        writer.writerow(['filepath', 'age', 'gender', 'duration', 'fs'])
-
-        for raw_line in fh:
-            line = raw_line.rstrip('\n\r')
+        if header:
+            writer.writerow(['filepath', 'age', 'gender', 'duration', 'fs'])
+        rows = []
+
+        mm.seek(start)
+        while mm.tell() < end:
+            raw_line = mm.readline()
+            line = raw_line.rstrip(b'\n\r')
+            low = line.lower()
+
+            # C-level substring checks skip the token scan on lines where nothing can match
+            # (channel lines only matter while a selective run still misses target labels)
+            if (b'.edf' in low or b'block' in low or
+                    (current_block == 6 and (b'duration' in low or b'hdr_sample_frequency' in low or
+                                             (b'channel[' in low and SELECTIVE_ELECTRODES and not current['matched'])))):
+                tokens = list(RE_TOKENS.finditer(low))
+            else:
+                tokens = ()
 
             # detect .edf occurrences (start of new record)
-            for m in RE_EDF.finditer(line):
-                candidate = m.group(1).strip().strip('"\'')
+            for m in tokens:
+                if m.lastgroup != 'edf':
+                    continue
+                candidate = to_text(line[m.start():m.end()].strip().strip(b'"\''))
                 # flush previous record
                 if current and current.get('path'):
-                    if flush_and_write(current, writer):
+                    if flush_and_write(current, rows):
                         written += 1
-                        csvf.flush()
+                        if len(rows) >= FLUSH_EVERY:
+                            writer.writerows(rows)
+                            rows.clear()
+                            csvf.flush()
                 # start new record; reset block
                 current = {
                     'path': candidate,
@@ -149,13 +252,14 @@ def process_stream(inpath, outpath):
                     'gender': None,
                     'duration': None,
                     'fs': None,
-                    'chan_names': set()
+                    'remaining': set(TARGET_SET),
+                    'matched': not TARGET_SET
                 }
                 current_block = None
                 scanned += 1
 
                 # parse tail of same line after match for age/gender
-                tail = line[m.end():]
+                tail = low[m.end():]
                 if current['age'] is None:
                     a = parse_line_for_age(tail)
                     if a:
@@ -169,74 +273,107 @@ def process_stream(inpath, outpath):
             if not current:
                 continue
 
-            # detect block header
-            bh = RE_BLOCK_HEADER.match(line)
-            if bh:
-                try:
-                    current_block = int(bh.group(1))
-                except Exception:
-                    current_block = None
-
-            # continuous age/gender parse while inside record
-            if current['age'] is None:
-                a = parse_line_for_age(line)
+            # label collection stops once every target electrode has been seen
+            collect_labels = SELECTIVE_ELECTRODES and not current['matched']
+
+            # block header, then Block 6 duration, fs and per-channel names
+            for m in tokens:
+                kind = m.lastgroup
+                if kind == 'block':
+                    try:
+                        current_block = int(m.group('block_num'))
+                    except Exception:
+                        current_block = None
+                elif current_block != 6:
+                    continue
+                elif kind == 'duration':
+                    try:
+                        current['duration'] = float(m.group('duration_val'))
+                    except Exception:
+                        current['duration'] = to_text(m.group('duration_val'))
+                elif kind == 'fs':
+                    try:
+                        current['fs'] = float(m.group('fs_val'))
+                    except Exception:
+                        current['fs'] = to_text(m.group('fs_val'))
+                elif kind == 'channel' and collect_labels:
+                    add_channel_name(current, line[m.start('channel_name'):m.end('channel_name')].strip())
+
+            # continuous age/gender parse while inside record; every age pattern needs
+            # "age" or a "y" unit suffix, every gender pattern needs "gender" or "sex"
+            if current['age'] is None and (b'age' in low or b'y' in low):
+                a = parse_line_for_age(low)
                 if a:
                     current['age'] = a
-            if current['gender'] is None:
-                g = parse_line_for_gender(line)
+            if current['gender'] is None and (b'gender' in low or b'sex' in low):
+                g = parse_line_for_gender(low)
                 if g:
                     current['gender'] = g
 
             # Block 5: collect chan_labels inside square brackets
-            if current_block == 5:
-                mcl = RE_CHAN_LABELS.search(line)
+            if current_block == 5 and collect_labels and b'[' in line:
+                mcl = RE_CHAN_LABELS.search(low)
                 if mcl:
-                    labels_part = mcl.group(1)
+                    labels_part = line[mcl.start(1):mcl.end(1)]
                     items = extract_bracket_items(labels_part)
                     for it in items:
-                        current['chan_names'].add(it.strip())
+                        add_channel_name(current, it.strip())
                 else:
                     # collect any bracketed items on the line
                     items = extract_bracket_items(line)
                     for it in items:
-                        current['chan_names'].add(it.strip())
-
-            # Block 6: extract duration, fs, and per-channel names
-            if current_block == 6:
-                md = RE_DURATION.search(line)
-                if md:
-                    try:
-                        current['duration'] = float(md.group(1))
-                    except Exception:
-                        current['duration'] = md.group(1)
-
-                mfs = RE_FS.search(line)
-                if mfs:
-                    try:
-                        current['fs'] = float(mfs.group(1))
-                    except Exception:
-                        current['fs'] = mfs.group(1)
-
-                # lines like: channel[   0]:      256.0 Hz (EEG FP1-REF)
-                mc = RE_CHANNEL_LINE.search(line)
-                if mc:
-                    name = mc.group(1).strip()
-                    current['chan_names'].add(name)
+                        add_channel_name(current, it.strip())
 
-                # some lines contain parentheses with electrode labels
-                for par in re.findall(r'\(([^)]+)\)', line):
+            # Block 6: some lines contain parentheses with electrode labels
+            if current_block == 6 and collect_labels and b'(' in line:
+                for par in scan_enclosed(line, b'(', b')'):
                     p = par.strip()
-                    if p.upper().startswith('EEG') or '-REF' in p:
-                        current['chan_names'].add(p)
+                    if p.upper().startswith(b'EEG') or b'-REF' in p:
+                        add_channel_name(current, p)
 
         # after loop, flush last record
         if current and current.get('path'):
-            if flush_and_write(current, writer):
+            if flush_and_write(current, rows):
                 written += 1
-                csvf.flush()
+        writer.writerows(rows)
 
-    return scanned, written, os.path.abspath(outpath)
+    return scanned, written
+
+def process_range_args(args):
+    return process_range(*args)
 
+def process_stream(inpath, outpath):
+    if not os.path.isfile(inpath):
+        raise SystemExit(f"Input file not found: {inpath}")
+
+    ranges = split_ranges(inpath, NUM_WORKERS * RANGES_PER_WORKER if NUM_WORKERS > 1 else 1)
+    if len(ranges) == 1:
+        scanned, written = process_range(inpath, *ranges[0], outpath, True)
+        return scanned, written, os.path.abspath(outpath)
+
+    # the first part carries the CSV header; imap yields in file order, so each part is
+    # appended (and flushed) as soon as it and every earlier part are done
+    part_paths = [f"{outpath}.part{k}" for k in range(len(ranges))]
+    jobs = [(inpath, start, end, part, k == 0)
+            for k, ((start, end), part) in enumerate(zip(ranges, part_paths))]
+    scanned = 0
+    written = 0
+    try:
+        with open(outpath, 'wb') as out, Pool(min(NUM_WORKERS, len(jobs))) as pool:
+            for part, (n_scanned, n_written) in zip(part_paths, pool.imap(process_range_args, jobs)):
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+                out.flush()
+                os.remove(part)
+                scanned += n_scanned
+                written += n_written
+    finally:
+        # a failed or interrupted run must not leave part files behind
+        for part in part_paths:
+            if os.path.exists(part):
+                os.remove(part)
+
+    return scanned, written, os.path.abspath(outpath)
 
 if __name__ == "__main__":
     scanned, written, outabs = process_stream(INPUT_TXT, OUTPUT_CSV)
@@ -1,3 +1,6 @@
+import os
+import re
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
@@ -8,50 +11,45 @@ INPUT_CSV = "../../outputs/TUH-EEG_selective_16.csv"
 OUTPUT_CSV = "../../outputs/valid_files.csv"
 BASE_PATH = Path("") # Insert path here: /somewhere/TUH_Healthy
 MIN_DURATION = 270
-
-
-def make_local_path(orig_fp: str) -> Path:
-    s = str(orig_fp).strip()
-    # remove all leading "../"
-    while s.startswith("../") or s.startswith("./"):
-        s = s[3:]
-    return BASE_PATH.joinpath(s).resolve()
+# Column types as written by step 01, so read_csv skips per-column type inference;
+# age is left to inference because it is coerced with to_numeric below anyway
+CSV_DTYPES = {"filepath": str, "gender": "category", "duration": "float64", "fs": "float64"}
+RE_LEADING_REL = re.compile(r"^(?:\.\.?/)+")  # leading "../" and "./" components
 
 
 def main():
-    df = pd.read_csv(INPUT_CSV)
-    # Build local absolute paths
-    df["_local_path"] = df["filepath"].apply(make_local_path)
+    df = pd.read_csv(INPUT_CSV, dtype=CSV_DTYPES)
+    # Build local absolute paths: remove all leading "../" and "./", then prefix the base
+    # directory (resolved once, not per row) and normalize as plain strings (no syscalls)
+    base = os.path.join(str(BASE_PATH.resolve()), "")
+    rel = df["filepath"].astype(str).str.strip().str.replace(RE_LEADING_REL, "", regex=True)
+    local_paths = np.array([os.path.normpath(p) for p in base + rel], dtype=object)
+
+    # Keep only rows where the file exists on disk: one walk of the base directory lists
+    # every .edf present, instead of one stat per row (slow on NFS / cold cache)
+    existing = set()
+    for root, _, files in os.walk(base, followlinks=True):
+        for f in files:
+            if f.lower().endswith(".edf"):
+                existing.add(os.path.normpath(os.path.join(root, f)))
+    exists_mask = np.fromiter((p in existing for p in local_paths),
+                              dtype=bool, count=len(local_paths))
 
-    # Keep only rows where the file exists on disk
-    mask = df["_local_path"].apply(lambda p: p.exists())
-    df_keep = df.loc[mask].copy()
+    # Filter files by minumum duration
+    duration_mask = (df["duration"] > MIN_DURATION).to_numpy()
 
-    # Replace filepath column with the full local path (string)
-    df_keep["filepath"] = df_keep["_local_path"].astype(str)
+    # Exclude rows where age is missing/non-numeric or the placeholder 999
+    age_num = pd.to_numeric(df["age"], errors="coerce").to_numpy()
+    age_mask = ~np.isnan(age_num) & (age_num != 999)
 
-    # Drop helper column and write CSV with the original column order
-    df_keep = df_keep.drop(columns=["_local_path"])
+    # Exclude rows where gender is missing (step 01 writes only "Male", "Female" or blank)
+    gender_mask = df["gender"].isin(("Male", "Female")).to_numpy()
 
-    # Filter files by minumum duration
-    df_keep = df_keep[df_keep["duration"] > MIN_DURATION]
-
-    # Exclude rows where age is missing/empty/'nan' or numeric 999
-    age_series = df_keep["age"]
-    age_str = age_series.fillna("").astype(str).str.strip()
-    age_not_blank = age_str.ne("") & ~age_str.str.lower().eq("nan")
-    age_num = pd.to_numeric(age_str, errors="coerce")
-    age_not_999 = ~(age_num == 999)
-    age_mask = age_not_blank & age_not_999
-
-    # Exclude rows where gender is missing/empty/'nan'
-    gender_series = df_keep["gender"]
-    gender_str = gender_series.fillna("").astype(str).str.strip()
-    gender_mask = gender_str.ne("") & ~gender_str.str.lower().eq("nan")
-
-    # combined mask: keep only rows having both age & gender
-    combined_mask = age_mask & gender_mask
-    df_keep = df_keep.loc[combined_mask].copy()
+    # All masks are computed on the full frame and filepath is replaced there (one
+    # column swap), so the kept rows are copied exactly once, by the single .loc[mask]
+    mask = exists_mask & duration_mask & age_mask & gender_mask
+    df["filepath"] = local_paths
+    df_keep = df.loc[mask]
 
     df_keep.to_csv(OUTPUT_CSV, index=False)
     print(f"{len(df_keep)} rows written to {OUTPUT_CSV}")
@@ -1,10 +1,12 @@
-import os, time
+import os, re, time, threading
 import requests
-from bs4 import BeautifulSoup
+from html import unescape
 from dotenv import load_dotenv
 from urllib.parse import urljoin, urlparse
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 """
 Recursively crawl a directory listing page and download all files
@@ -15,6 +17,9 @@ Authentication: HTTP Basic only.
 
 Skips files that have already been downloaded; downloads can be cancelled
 halfway and then restarted later, resuming from where it was cancelled off.
+
+The directory listing is walked on the main thread, while file downloads are
+handed to a pool of MAX_WORKERS threads sharing one keep-alive session.
 """
 
 
@@ -24,116 +29,173 @@ URL = os.getenv("URL")
 USERNAME = os.getenv("USRNAME")
 PASSWORD = os.getenv("PSSWORD")
 
-DELAY = 0.1
+MAX_WORKERS = 16
+POOL_SIZE = 32          # pooled keep-alive connections; must cover MAX_WORKERS + the crawler
+REQUESTS_PER_SEC = 10   # politeness limit shared by all threads (the old 0.1 s delay); 0 disables it
 SKIP_EXISTING = True
 OUTPUT_DIR = "./../../TUH-EEG"
 DEFAULT_CHUNK = 1024 * 64
 
+# directory listings (Apache/nginx autoindex) only need their <a href> values
+RE_HREF = re.compile(r'''<a\s[^>]*?href=["']([^"']+)["']''', re.I | re.ASCII)
+
+_rate_lock = threading.Lock()
+_next_slot = 0.0
+
 
 def make_session():
     s = requests.Session()
     retries = Retry(total=5, backoff_factor=0.5, status_forcelist=(500,502,503,504))
-    s.mount("https://", HTTPAdapter(max_retries=retries))
-    s.mount("http://", HTTPAdapter(max_retries=retries))
+    # keep enough pooled sockets that no thread's connection (and TLS session) is discarded
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retries)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    # index pages compress well; file downloads override Accept-Encoding themselves
+    s.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
 
     if USERNAME and PASSWORD:
         s.auth = (USERNAME, PASSWORD)
     return s
 
+def throttle():
+    """Block until the next request slot is free (no-op when REQUESTS_PER_SEC is 0)."""
+    global _next_slot
+    if not REQUESTS_PER_SEC:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(_next_slot, now)
+        _next_slot = slot + 1.0 / REQUESTS_PER_SEC
+    time.sleep(slot - now)
+
 def sanitize_url(u):
     p = urlparse(u)
     return p._replace(query='', fragment='').geturl()
 
-def rel_path_from_root(root_url, target_url):
-    root_path = urlparse(root_url).path
-    target_path = urlparse(target_url).path
-    if not root_path.endswith('/'):
-        root_path = root_path + '/'
-    if target_path.startswith(root_path):
-        rel = target_path[len(root_path):]
+def rel_path_from_root(root_path, target_url):
+    """root_path is urlparse(root_url).path with a trailing '/', computed once per crawl."""
+    target = urlparse(target_url)
+    if target.path.startswith(root_path):
+        rel = target.path[len(root_path):]
     else:
-        rel = urlparse(target_url).netloc + target_path
+        rel = target.netloc + target.path
     return rel.lstrip('/')
 
 def download_file(session, file_url, local_path):
-    try:
-        # skip if exists and same size
-        if os.path.exists(local_path) and SKIP_EXISTING:
-            try:
-                head = session.head(file_url, allow_redirects=True, timeout=30)
-                if head.status_code == 200 and 'Content-Length' in head.headers:
-                    expected = int(head.headers.get('Content-Length', -1))
-                    if expected >= 0 and os.path.getsize(local_path) == expected:
-                        print(f"SKIP (exists): {local_path}")
-                        return
-            except Exception:
-                pass
-
-        with session.get(file_url, stream=True, timeout=60) as r:
-            r.raise_for_status()
-            tmp = local_path + ".part"
-            dirpath = os.path.dirname(local_path) or OUTPUT_DIR
-            os.makedirs(dirpath, exist_ok=True)
-            # write stream to temporary file
-            with open(tmp, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=DEFAULT_CHUNK):
-                    if chunk:
-                        f.write(chunk)
+    """Runs on a worker thread; errors propagate to the future and are reported in main()."""
+    # finished files are only ever renamed into place, so existing means complete
+    if os.path.exists(local_path) and SKIP_EXISTING:
+        print(f"SKIP (exists): {local_path}")
+        return
+
+    # resume an interrupted download from the end of its .part file;
+    # identity encoding keeps the server's byte offsets equal to ours
+    tmp = local_path + ".part"
+    existing = os.path.getsize(tmp) if os.path.exists(tmp) else 0
+    headers = {'Accept-Encoding': 'identity'}
+    if existing:
+        headers['Range'] = f'bytes={existing}-'
+
+    throttle()
+    r = session.get(file_url, stream=True, timeout=60, headers=headers)
+    if r.status_code == 416 and existing:
+        r.close()
+        # nothing left to fetch if the .part already holds the whole file
+        if r.headers.get('Content-Range') == f'bytes */{existing}':
             os.replace(tmp, local_path)
             print(f"DOWNLOADED: {local_path}")
-    except Exception as e:
-        print(f"ERROR downloading {file_url} -> {e}")
-
-def crawl_index(session, root_url, current_url, output_dir, visited):
-    current_url = sanitize_url(current_url)
-    if current_url in visited:
-        return
-    visited.add(current_url)
-    try:
-        r = session.get(current_url, timeout=30)
+            return
+        # stale .part (remote file changed); drop it and fetch the whole file now
+        os.remove(tmp)
+        existing = 0
+        del headers['Range']
+        throttle()
+        r = session.get(file_url, stream=True, timeout=60, headers=headers)
+    with r:
         r.raise_for_status()
-    except Exception as e:
-        print(f"ERROR fetching {current_url} -> {e}")
-        return
-
-    soup = BeautifulSoup(r.text, "html.parser")
-    links = soup.find_all("a")
-    for a in links:
-        href = a.get('href')
-        if not href:
-            continue
-        text = (a.text or "").strip()
-        # skip parent links
-        if text.lower().startswith('parent') or href in ('../', '/'):
+        if r.status_code == 200 and existing and int(r.headers.get('Content-Length', -1)) == existing:
+            # server ignored the Range header but the .part is already complete
+            os.replace(tmp, local_path)
+            print(f"DOWNLOADED: {local_path}")
+            return
+        dirpath = os.path.dirname(local_path) or OUTPUT_DIR
+        os.makedirs(dirpath, exist_ok=True)
+        # append on 206 Partial Content, otherwise the server sent the whole file
+        mode = 'ab' if r.status_code == 206 else 'wb'
+        with open(tmp, mode) as f:
+            for chunk in r.iter_content(chunk_size=DEFAULT_CHUNK):
+                if chunk:
+                    f.write(chunk)
+        os.replace(tmp, local_path)
+        print(f"DOWNLOADED: {local_path}")
+
+def crawl_index(session, root_url, output_dir, executor, futures):
+    """Walk the listing tree with an explicit queue (no recursion) and submit every file to executor."""
+    root_path = urlparse(root_url).path
+    if not root_path.endswith('/'):
+        root_path = root_path + '/'
+    visited = set()
+    queue = deque([root_url])
+    while queue:
+        current_url = sanitize_url(queue.popleft())
+        if current_url in visited:
             continue
-        # ignore anchors/mailto/javascript
-        if href.startswith('#') or href.startswith('mailto:') or href.lower().startswith('javascript:'):
+        visited.add(current_url)
+        try:
+            throttle()
+            r = session.get(current_url, timeout=30)
+            r.raise_for_status()
+        except Exception as e:
+            print(f"ERROR fetching {current_url} -> {e}")
             continue
 
-        full = urljoin(current_url, href)
-        full = sanitize_url(full)
-
-        # decide if directory
-        if href.endswith('/') or full.endswith('/'):
-            rel = rel_path_from_root(root_url, full)
-            local_dir = os.path.join(output_dir, rel)
-            os.makedirs(local_dir, exist_ok=True)
-            time.sleep(DELAY)
-            crawl_index(session, root_url, full, output_dir, visited)
-        else:
-            rel = rel_path_from_root(root_url, full)
-            local_file = os.path.join(output_dir, rel)
-            if os.path.isdir(local_file):
-                local_file = local_file + ".file"
-            download_file(session, full, local_file)
-            time.sleep(DELAY)
+        for href in RE_HREF.findall(r.text):
+            href = unescape(href)
+            # skip parent links
+            if href in ('../', './', '/'):
+                continue
+            # ignore anchors/mailto/javascript
+            if href.startswith('#') or href.startswith('mailto:') or href.lower().startswith('javascript:'):
+                continue
+
+            full = urljoin(current_url, href)
+            full = sanitize_url(full)
+            # absolute "Parent Directory" links and off-site links lead out of the tree
+            if not full.startswith(root_url):
+                continue
+
+            # decide if directory
+            if href.endswith('/') or full.endswith('/'):
+                rel = rel_path_from_root(root_path, full)
+                local_dir = os.path.join(output_dir, rel)
+                os.makedirs(local_dir, exist_ok=True)
+                queue.append(full)
+            else:
+                rel = rel_path_from_root(root_path, full)
+                local_file = os.path.join(output_dir, rel)
+                if os.path.isdir(local_file):
+                    local_file = local_file + ".file"
+                futures[executor.submit(download_file, session, full, local_file)] = full
 
 def main():
     root = URL if URL.endswith('/') else URL + '/'
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     session = make_session()
-    visited = set()
-    crawl_index(session, root, root, OUTPUT_DIR, visited)
+    futures = {}    # future -> file url, for error reporting
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    try:
+        crawl_index(session, root, OUTPUT_DIR, executor, futures)
+        for fut in as_completed(futures):
+            try:
+                fut.result()
+            except Exception as e:
+                print(f"ERROR downloading {futures[fut]} -> {e}")
+    except BaseException:
+        # Ctrl-C: drop every queued download instead of draining the queue;
+        # in-flight files keep their .part and resume on the next run
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
 
 if __name__ == "__main__":
     main()
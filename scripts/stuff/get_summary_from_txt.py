@@ -1,5 +1,8 @@
+import io
+import os
 import re
 import json
+import mmap
 from collections import Counter, defaultdict
 
 """
@@ -13,6 +16,8 @@ Stream-parse headers.txt and produce JSON summary.
 - ELECTRODES_NOT_UNIQUE_LIST : [ '<full_filepath>', ... ]
 
 Notes:
+- headers.txt is memory-mapped and matched as bytes; only captured values
+  (file paths, labels) are decoded to str.
 - Labels used for electrodes_all are taken only from Block 6 channel parentheticals.
 - Only Block 6 channels whose parenthetical contains EEG/ECG/EKG (case-insensitive)
   and that do not match the EXCLUDE_KEYWORDS are counted.
@@ -23,14 +28,19 @@ INPUT_PATH = "./../TUH-EEG/headers.txt"
 OUT_PATH = "./../outputs/data_summary.json"
 
 # regexes
-re_file_start = re.compile(r'^\s*\d+:\s*(\S.*)$')
-re_block_start = re.compile(r'^\s*Block\s+(\d+)\s*:', re.IGNORECASE)
-re_hdr_fs = re.compile(r'^\s*hdr_sample_frequency\s*=\s*([0-9]+(?:\.[0-9]+)?)', re.IGNORECASE)
-re_channel_fs_with_label = re.compile(r'^\s*channel\[\s*\d+\]\s*:\s*([0-9]+(?:\.[0-9]+)?)\s*Hz\s*\((.*?)\)', re.IGNORECASE)
-re_channel_fs = re.compile(r'^\s*channel\[\s*\d+\]\s*:\s*([0-9]+(?:\.[0-9]+)?)\s*Hz', re.IGNORECASE)
-re_chan_labels_start = re.compile(r'^\s*chan_labels\s*\(\s*\d+\s*\)\s*=\s*(.*)', re.IGNORECASE)
-re_bracket = re.compile(r'\[([^\]]+)\]')
-re_chan_trans_type_start = re.compile(r'^\s*chan_trans_type', re.IGNORECASE)
+# One anchored alternation classifies each line in a single match(); the outer
+# named group that matched (m.lastgroup) tells which kind of line it is.
+re_line = re.compile(
+    rb'^\s*(?:'
+    rb'(?P<file>\d+:\s*(?P<file_path>\S.*))'
+    rb'|(?P<block>Block\s+(?P<block_num>\d+)\s*:)'
+    rb'|(?P<hdr_fs>hdr_sample_frequency\s*=\s*(?P<hdr_fs_val>[0-9]+(?:\.[0-9]+)?))'
+    rb'|(?P<channel>channel\[\s*\d+\]\s*:\s*(?P<ch_fs>[0-9]+(?:\.[0-9]+)?)\s*Hz(?:\s*\((?P<ch_label>.*?)\))?)'
+    rb'|(?P<chan_labels>chan_labels\s*\(\s*\d+\s*\)\s*=\s*(?P<chan_labels_rest>.*))'
+    rb'|(?P<chan_trans_type>chan_trans_type)'
+    rb')',
+    re.IGNORECASE)
+re_bracket = re.compile(rb'\[([^\]]+)\]')
 
 # outputs / counters
 fs_all = {}                                      # filepath -> hdr_sample_frequency (float) or None
@@ -45,6 +55,15 @@ ELECTRODES_NOT_UNIQUE = 0
 ELECTRODES_NOT_UNIQUE_LIST = []
 
 # helpers
+def to_text(raw: bytes) -> str:
+    return raw.decode('utf-8', errors='replace')
+
+def map_readonly(fh):
+    """Read-only mmap of an open binary file (mmap refuses empty files, so use an empty buffer)."""
+    if os.fstat(fh.fileno()).st_size == 0:
+        return io.BytesIO()
+    return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
 def normalize_label_preserve(raw: str) -> str:
     """
     Preserve label content but trim and uppercase.
@@ -53,20 +72,17 @@ def normalize_label_preserve(raw: str) -> str:
     return raw.strip().upper()
 
 def floats_all_equal(lst, tol=1e-6):
-    if not lst:
-        return True
-    first = lst[0]
-    for x in lst:
-        if abs(x - first) > tol:
-            return False
-    return True
+    return not lst or max(lst) - min(lst) <= tol
 
 # Exclude tokens that should not be counted as electrodes even if in Block 6
 EXCLUDE_KEYWORDS = [
     r'PULSE', r'PULSE\s+RATE', r'IBI', r'BURST', r'BURSTS',
     r'SUPPR', r'SUPPRESSION', r'RESP', r'PHOTIC', r'DC', r'LOC'
 ]
-re_exclude = re.compile(r'(?i)\b(?:' + '|'.join(k for k in EXCLUDE_KEYWORDS) + r')\b')
+# A label is kept when it contains EEG/ECG/EKG and no EXCLUDE_KEYWORDS token anywhere;
+# both conditions are checked in a single match() from the start of the label.
+re_keep_label = re.compile(
+    (r'(?i)(?!.*\b(?:' + '|'.join(k for k in EXCLUDE_KEYWORDS) + r')\b).*?\b(?:EEG|ECG|EKG)\b').encode('ascii'))
 
 # streaming parse state
 current_fp = None
@@ -75,27 +91,28 @@ collecting_chan_labels = False
 pending_chan_labels = []
 
 try:
-    with open(INPUT_PATH, 'r', encoding='utf-8', errors='replace') as fh:
-        for raw in fh:
-            line = raw.rstrip('\n')
+    with open(INPUT_PATH, 'rb') as fh, map_readonly(fh) as mm:
+        for raw in iter(mm.readline, b''):
+            line = raw.rstrip(b'\r\n')
+
+            m = re_line.match(line)
+            kind = m.lastgroup if m else None
 
             # detect new file
-            mfile = re_file_start.match(line)
-            if mfile:
+            if kind == 'file':
                 # finalize pending chan_labels for previous file
                 if current_fp is not None:
                     if pending_chan_labels:
-                        processed = [normalize_label_preserve(t) for t in pending_chan_labels]
+                        processed = [normalize_label_preserve(to_text(t)) for t in pending_chan_labels]
                         per_file_labels[current_fp] = processed
-                        c = Counter(processed)
-                        if any(v > 1 for v in c.values()):
+                        if len(processed) != len(set(processed)):
                             ELECTRODES_NOT_UNIQUE += 1
                             ELECTRODES_NOT_UNIQUE_LIST.append(current_fp)
                         pending_chan_labels = []
                     else:
                         per_file_labels.setdefault(current_fp, [])
                 # start new file block
-                current_fp = mfile.group(1).strip()
+                current_fp = to_text(m.group('file_path').strip())
                 fs_all.setdefault(current_fp, None)
                 per_file_block6_channel_fs[current_fp] = []
                 in_block6 = False
@@ -107,74 +124,66 @@ try:
                 continue
 
             # detect block starts; update in_block6 on block number
-            mb = re_block_start.match(line)
-            if mb:
-                block_num = int(mb.group(1))
+            if kind == 'block':
+                block_num = int(m.group('block_num'))
                 in_block6 = (block_num == 6)
 
             # also mark block6 if line contains 'derived values' or 'per channel sample frequencies'
             low = line.lower()
-            if 'derived values' in low or 'per channel sample frequencies' in low:
+            if b'derived values' in low or b'per channel sample frequencies' in low:
                 in_block6 = True
 
             # hdr_sample_frequency anywhere -> fs_all
-            mh = re_hdr_fs.match(line)
-            if mh:
+            if kind == 'hdr_fs':
                 try:
-                    fs_val = float(mh.group(1))
+                    fs_val = float(m.group('hdr_fs_val'))
                 except Exception:
                     fs_val = None
                 fs_all[current_fp] = fs_val
                 continue
 
             # channel lines with labels: only Block6 EEG/ECG/EKG channels contribute to electrodes_all and FS_NOT_SAME
-            mch_label = re_channel_fs_with_label.match(line)
-            if mch_label:
+            # (channel fs lines without a label are ignored for Block6-specific collections)
+            if kind == 'channel':
+                label_text = m.group('ch_label')
+                if label_text is None:
+                    continue
                 try:
-                    ch_fs = float(mch_label.group(1))
+                    ch_fs = float(m.group('ch_fs'))
                 except Exception:
                     ch_fs = None
-                label_text = mch_label.group(2).strip()
+                label_text = label_text.strip()
 
                 # If in Block 6 and label contains EEG/ECG/EKG and not excluded, use it.
-                if in_block6 and re.search(r'(?i)\b(EEG|ECG|EKG)\b', label_text) and not re_exclude.search(label_text):
+                # (the modality token guarantees the label is non-empty and alphabetic)
+                if in_block6 and re_keep_label.match(label_text):
                     if ch_fs is not None:
                         per_file_block6_channel_fs[current_fp].append(ch_fs)
-                    norm = normalize_label_preserve(label_text)
-                    # require at least one alphabetic char to avoid numeric noise
-                    if norm and re.search(r'[A-Z]', norm):
-                        electrodes_all[norm] += 1
-
-                continue
+                    electrodes_all[normalize_label_preserve(to_text(label_text))] += 1
 
-            # fallback channel fs without label (ignored for Block6-specific collections)
-            mch = re_channel_fs.match(line)
-            if mch:
                 continue
 
             # collect chan_labels (unchanged behavior used for ELECTRODES_NOT_UNIQUE check)
-            mcl = re_chan_labels_start.match(line)
-            if mcl:
+            if kind == 'chan_labels':
                 collecting_chan_labels = True
-                rest = mcl.group(1)
+                rest = m.group('chan_labels_rest')
                 found = re_bracket.findall(rest)
                 if found:
                     pending_chan_labels.extend(found)
                 continue
 
             if collecting_chan_labels:
-                if re_chan_trans_type_start.match(line):
+                if kind == 'chan_trans_type':
                     collecting_chan_labels = False
                     if pending_chan_labels:
-                        processed = [normalize_label_preserve(t) for t in pending_chan_labels]
+                        processed = [normalize_label_preserve(to_text(t)) for t in pending_chan_labels]
                         per_file_labels[current_fp] = processed
-                        c = Counter(processed)
-                        if any(v > 1 for v in c.values()):
+                        if len(processed) != len(set(processed)):
                             ELECTRODES_NOT_UNIQUE += 1
                             ELECTRODES_NOT_UNIQUE_LIST.append(current_fp)
                         pending_chan_labels = []
                     continue
-                if '[' in line:
+                if b'[' in line:
                     found = re_bracket.findall(line)
                     if found:
                         pending_chan_labels.extend(found)
@@ -183,10 +192,9 @@ try:
 
     # finalize last file's pending chan_labels if any
     if current_fp is not None and pending_chan_labels:
-        processed = [normalize_label_preserve(t) for t in pending_chan_labels]
+        processed = [normalize_label_preserve(to_text(t)) for t in pending_chan_labels]
         per_file_labels[current_fp] = processed
-        c = Counter(processed)
-        if any(v > 1 for v in c.values()):
+        if len(processed) != len(set(processed)):
             ELECTRODES_NOT_UNIQUE += 1
             ELECTRODES_NOT_UNIQUE_LIST.append(current_fp)
         pending_chan_labels = []
@@ -216,10 +224,10 @@ summary = {
     "ELECTRODES_NOT_UNIQUE_LIST": ELECTRODES_NOT_UNIQUE_LIST
 }
 
-# write JSON summary
+# write JSON summary (compact: json.dumps without indent runs the C encoder, json.dump never does)
 try:
     with open(OUT_PATH, 'w', encoding='utf-8') as outf:
-        json.dump(summary, outf, indent=2, sort_keys=True)
+        outf.write(json.dumps(summary, sort_keys=True, separators=(',', ':')))
 except Exception as e:
     print("Failed to write summary file:", e)
 